@@ -71,6 +71,8 @@ The following kernel-specific options are provided by this plugin:
       (array of strings)
       Optional, define the compiler path to be added to the PATH.
       Path is relative to the stage directory.
+      Paths are prepended to PATH in the listed order, so earlier
+      entries take precedence.
       Default value is empty.
 
     - kernel-compiler-parameters
@@ -102,14 +104,16 @@ The following kernel-specific options are provided by this plugin:
     - kernel-initrd-compression:
       (string; default: as defined in ubuntu-core-initrd(lz4)
       initrd compression to use; the only supported values now are
-      'lz4', 'xz', 'gz'.
+      'lz4', 'xz', 'gz', 'zstd'.
+      zstd needs a kernel that can unpack it (CONFIG_RD_ZSTD, 5.9+).
 
     - kernel-initrd-compression-options:
       Optional list of parameters to be passed to compressor used for initrd
       (array of string): defaults are
-        gz:  -7
-        lz4: -9 -l
-        xz:  -7
+        gz:   -7
+        lz4:  -9 -l
+        xz:   -7
+        zstd: -19 -T0
 
     - kernel-initrd-channel
       Optional channel for snapd snap to pick snap-bootstrap from.
@@ -146,25 +150,52 @@ The following kernel-specific options are provided by this plugin:
     - kernel-enable-perf
        (boolean; default: False)
        use this flag to build the perf binary
+
+    - kernel-download-cache
+      (boolean; default: False)
+      Keep the downloaded ubuntu-core-initramfs deb and snapd snap in
+      ${SNAPCRAFT_PROJECT_DIR}/.snapcraft-kernel-cache and reuse them on
+      rebuilds. Entries are keyed on release, channel and architecture only
+      and are never refreshed, so updates (incl. security fixes) published
+      to the channel are not picked up until the directory (or its entry)
+      is removed. Meant for iterating on local builds, not for release
+      builds. The cached snapd revision and version are printed whenever
+      they are reused.
 """
 
 import click
+import copy
+import functools
+import hashlib
 import os
 import sys
 import re
+import shlex
 
 from snapcraft import ProjectOptions
+from types import MappingProxyType
 from typing import Any, Dict, List, Set
 
 from snapcraft.plugins.v2 import PluginV2
 
-_compression_command = {"gz": "gzip", "lz4": "lz4", "xz": "xz"}
-_compressor_options = {"gz": "-7", "lz4": "-l -9", "xz": "-7"}
+_compression_command = MappingProxyType(
+    {"gz": "gzip", "lz4": "lz4", "xz": "xz", "zstd": "zstd"}
+)
+_compressor_options = MappingProxyType(
+    {"gz": "-7", "lz4": "-l -9", "xz": "-7", "zstd": "-19 -T0"}
+)
 _SNAPD_SNAP_NAME = "snapd"
 _SNAPD_SNAP_FILE = "{snap_name}_{architecture}.snap"
 _ZFS_URL = "https://github.com/openzfs/zfs"
-
-default_kernel_image_target = {
+_MAKE_JOBS = "-j$(nproc)"
+# downloads are kept here across rebuilds, remove it to fetch fresh copies
+_DOWNLOAD_CACHE_DIR = "${SNAPCRAFT_PROJECT_DIR}/.snapcraft-kernel-cache"
+# architecture of the host snapcraft runs on, set in the snap environment
+_HOST_ARCH = os.environ.get("SNAP_ARCH")
+# include dirs passed down by snapcraft's MAKEFLAGS, stripped from the build env
+_MAKEFLAGS_INCLUDE_RE = re.compile(r"-I[\S]*")
+
+default_kernel_image_target = MappingProxyType({
     "amd64": "bzImage",
     "i386": "bzImage",
     "armhf": "zImage",
@@ -173,9 +204,25 @@ default_kernel_image_target = {
     "ppc64el": "vmlinux.strip",
     "s390x": "bzImage",
     "riscv64": "Image",
-}
+})
+
+_KERNEL_ARCH_MAP = MappingProxyType({
+    "armhf": "arm",
+    "arm64": "arm64",
+    "riscv64": "riscv",
+    "amd64": "x86",
+})
 
-required_generic = [
+_DEB_ARCH_MAP = MappingProxyType({arch: arch for arch in _KERNEL_ARCH_MAP})
+
+# kernel (not deb) architectures that ship device trees
+_DTB_ARCHES = frozenset(("arm", "arm64", "riscv"))
+_DTBS_INSTALL_TARGETS = (
+    "dtbs_install",
+    "INSTALL_DTBS_PATH=${SNAPCRAFT_PART_INSTALL}/dtbs",
+)
+
+required_generic = (
     "DEVTMPFS",
     "DEVTMPFS_MOUNT",
     "TMPFS_POSIX_ACL",
@@ -185,9 +232,9 @@ required_generic = [
     "VFAT_FS",
     "NLS_CODEPAGE_437",
     "NLS_ISO8859_1",
-]
+)
 
-required_security = [
+required_security = (
     "SECURITY",
     "SECURITY_APPARMOR",
     "SYN_COOKIES",
@@ -199,9 +246,9 @@ required_security = [
     "CC_STACKPROTECTOR_STRONG",
     "DEBUG_RODATA",
     "DEBUG_SET_MODULE_RONX",
-]
+)
 
-required_snappy = [
+required_snappy = (
     "RD_LZMA",
     "KEYS",
     "ENCRYPTED_KEYS",
@@ -209,9 +256,9 @@ required_snappy = [
     "SQUASHFS_XATTR",
     "SQUASHFS_XZ",
     "DEVPTS_MULTIPLE_INSTANCES",
-]
+)
 
-required_systemd = [
+required_systemd = (
     "DEVTMPFS",
     "CGROUPS",
     "INOTIFY_USER",
@@ -229,124 +276,312 @@ required_systemd = [
     "TMPFS_POSIX_ACL",
     "TMPFS_XATTR",
     "SECCOMP",
-]
+)
 
-required_boot = ["squashfs"]
+required_boot = ("squashfs",)
+
+# ordered and de-duplicated so the warning lists each option once
+_REQUIRED_OPTS = tuple(
+    dict.fromkeys(
+        f"CONFIG_{code}"
+        for code in (
+            required_generic + required_security + required_snappy + required_systemd
+        )
+    )
+)
+_REQUIRED_BOOT_OPTS = tuple((code, f"CONFIG_{code.upper()}") for code in required_boot)
+
+_OPT_NOTES = MappingProxyType(
+    {
+        "CONFIG_CC_STACKPROTECTOR_STRONG": "(4.1.x and later versions only)",
+        "CONFIG_DEVPTS_MULTIPLE_INSTANCES": "(4.8.x and earlier versions only)",
+    }
+)
+
+_MISSING_OPTS_WARNING = (
+    "**** WARNING **** WARNING **** WARNING **** WARNING ****\n"
+    "Your kernel config is missing some features that Ubuntu Core "
+    "recommends or requires.\n"
+    "While we will not prevent you from building this kernel snap, "
+    "we suggest you take a look at these:\n"
+)
+
+_MISSING_BOOT_OPTS_WARNING = (
+    "**** WARNING **** WARNING **** WARNING **** WARNING ****\n"
+    "The following features are deemed boot essential for\n"
+    "ubuntu core, consider making them static[=Y] or adding\n"
+    "the corresponding module to initrd:\n"
+)
+
+_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "type": "object",
+    "additionalProperties": False,
+    "properties": {
+        "kdefconfig": {"type": "array", "default": ["defconfig"]},
+        "kconfigfile": {"type": "string", "default": None},
+        "kconfigflavour": {"type": "string", "default": ""},
+        "kconfigs": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-image-target": {
+            "oneOf": [{"type": "string"}, {"type": "object"}],
+            "default": "",
+        },
+        "kernel-with-firmware": {
+            "type": "boolean",
+            "default": True,
+        },
+        "kernel-device-trees": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-initrd-modules": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-initrd-configured-modules": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-initrd-firmware": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-initrd-compression": {
+            "type": "string",
+            "enum": ["lz4", "xz", "gz", "zstd"],
+        },
+        "kernel-initrd-compression-options": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-initrd-channel": {
+            "type": "string",
+            "default": "stable",
+        },
+        "kernel-initrd-overlay": {
+            "type": "string",
+            "default": "",
+        },
+        "kernel-initrd-addons": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-build-efi-image": {
+            "type": "boolean",
+            "default": False,
+        },
+        "kernel-compiler": {
+            "type": "string",
+            "default": "",
+        },
+        "kernel-compiler-paths": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-compiler-parameters": {
+            "type": "array",
+            "minitems": 1,
+            "uniqueItems": True,
+            "items": {"type": "string"},
+            "default": [],
+        },
+        "kernel-enable-zfs-support": {
+            "type": "boolean",
+            "default": False,
+        },
+        "kernel-enable-perf": {
+            "type": "boolean",
+            "default": False,
+        },
+        "kernel-download-cache": {
+            "type": "boolean",
+            "default": False,
+        },
+    },
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _schema_validator() -> Any:
+    # built on first use only, most runs never validate options here
+    import jsonschema
+
+    return jsonschema.Draft4Validator(_SCHEMA)
+
+
+# static bash helpers emitted at the top of the build script
+_LINK_FILES_FNC_CMD = """\
+# link files, accept wild cards
+# 1: reference dir, 2: file(s) including wild cards, 3: dst dir
+link_files() {
+\tif [ "${2}" = "*" ]; then
+\t\tfor f in $(ls ${1})
+\t\tdo
+\t\t\tlink_files ${1} ${f} ${3}
+\t\tdone
+\t\treturn 0
+\tfi
+\tif [ -d ${1}/${2} ]; then
+\t\tfor f in $(ls ${1}/${2})
+\t\tdo
+\t\t\tlink_files ${1} ${2}/${f} ${3}
+\t\tdone
+\t\treturn 0
+\tfi
+
+\tlocal found=""
+\tfor f in $(ls ${1}/${2})
+\tdo
+\t\tif [[ -L "${f}" ]]; then
+\t\t\tlocal rel_path=$( realpath --no-symlinks --relative-to=${1} ${f} )
+\t\telse
+\t\t\tlocal rel_path=$( realpath -se --relative-to=${1} ${f} )
+\t\tfi
+\t\tlocal dir_path=$(dirname ${rel_path})
+\t\tmkdir -p ${3}/${dir_path}
+\t\techo "installing ${f} to ${3}/${dir_path}"
+\t\tln -f ${f} ${3}/${dir_path}
+\t\tfound="yes"
+\tdone
+\tif [ "yes" = "${found}" ]; then
+\t\treturn 0
+\telse
+\t\treturn 1
+\tfi
+}
+""".splitlines()
+
+_DOWNLOAD_CORE_INITRD_FNC_CMD = """\
+# Helper to download code initrd dep package
+# 1: tmp dir, 2: arch, 3: release, 4: output dir, 5: download cache dir (optional)
+download_core_initrd() {
+\tlocal tmp_dir=${1}
+\tlocal dpkg_arch=${2}
+\tlocal release=${3}
+\tlocal output_dir=${4}
+\tlocal cache_dir=${5:-}
+\tlocal apt_dir=${tmp_dir}/apt
+\tlocal sources_p=${apt_dir}/ppa.list
+\tlocal stage_dir=${apt_dir}/stage
+\tlocal status_p=${stage_dir}/status
+\tmkdir -p "${stage_dir}"
+\ttouch "${status_p}"
+\tcat > "${sources_p}" <<EOF
+deb https://ppa.launchpadcontent.net/snappy-dev/image/ubuntu ${release} main
+EOF
+\tlocal apt_options=(
+\t\t"-o" "APT::Architecture=$dpkg_arch"
+\t\t"-o" "APT::Get::AllowUnauthenticated=true"
+\t\t"-o" "Acquire::AllowInsecureRepositories=true"
+\t"-o" "Dir::Etc=${apt_dir}"
+\t"-o" "Dir::Etc::sourcelist=$sources_p"
+\t\t"-o" "Dir::Cache=$${stage_dir}/var/cache/apt"
+\t\t-oDir::State=${stage_dir}
+\t"-o" "Dir::State::status=$status_p"
+\t\t"-o" "pkgCacheGen::Essential=none")
+\tmkdir -p ${apt_dir}/preferences.d
+\tlocal deb=""
+\tif [ -n "${cache_dir}" ]; then
+\t\tfor f in ${cache_dir}/ubuntu-core-initramfs_*.deb
+\t\tdo
+\t\t\tif [ -f "${f}" ]; then
+\t\t\t\tdeb=${f}
+\t\t\tfi
+\t\tdone
+\tfi
+\tif [ -n "${deb}" ]; then
+\t\techo "Using cached ubuntu-core-initramfs deb ${deb}"
+\telse
+\t\trm -f ${tmp_dir}/ubuntu-core-initramfs_*.deb
+\t\tapt update "${apt_options[@]}"
+\t\t(cd ${tmp_dir} && apt download "${apt_options[@]}" ubuntu-core-initramfs)
+\t\tdeb=$(ls ${tmp_dir}/ubuntu-core-initramfs_*.deb)
+\t\tif [ -n "${cache_dir}" ]; then
+\t\t\t# copy under a temporary name in the cache dir first, the rename
+\t\t\t# is atomic so an interrupted copy never looks like a cached deb
+\t\t\tmkdir -p ${cache_dir}
+\t\t\tcp ${deb} ${cache_dir}/.$(basename ${deb}).tmp
+\t\t\tmv ${cache_dir}/.$(basename ${deb}).tmp ${cache_dir}/$(basename ${deb})
+\t\tfi
+\tfi
+
+# unpack dep to the target dir
+\tdpkg -x ${deb} ${output_dir}
+}
+""".splitlines()
+
+# install selected snap bootstrap, both links run concurrently and a
+# failure of either still fails the build
+_SNAP_BOOTSTRAP_FEATURE_CMD = """\
+echo "Preparing snap-boostrap initrd feature..."
+uc_initrd_feature_snap_bootstratp=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/snap-bootstrap
+mkdir -p ${uc_initrd_feature_snap_bootstratp}
+link_files ${SNAPD_UNPACKED_SNAP} usr/lib/snapd/snap-bootstrap ${uc_initrd_feature_snap_bootstratp} &
+snap_bootstrap_pid=$!
+link_files ${SNAPD_UNPACKED_SNAP} usr/lib/snapd/info ${uc_initrd_feature_snap_bootstratp}
+wait ${snap_bootstrap_pid}
+cp ${SNAPD_UNPACKED_SNAP}/usr/lib/snapd/info ${SNAPCRAFT_PART_INSTALL}/snapd-info
+""".splitlines()
+
+_LINK_FILES_WORKAROUND_CMD = """\
+echo "Workaround for bug in ubuntu-core-initramfs"
+for feature in kernel-modules snap-bootstrap uc-firmware uc-overlay
+do
+\tlink_files ${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/${feature} "*" ${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/main
+done
+""".splitlines()
+
+
+def _download_cache_dir(key: str) -> str:
+    # keyed on what is requested, so a different channel/release/arch never
+    # collides; a moving channel is not re-fetched until the cache is removed
+    return f"{_DOWNLOAD_CACHE_DIR}/{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+@functools.lru_cache(maxsize=1)
+def _host_deb_arch() -> str:
+    # ProjectOptions probes the host, only do it once per process
+    return ProjectOptions().deb_arch
 
 
 # class KernelPlugin(PluginV2):
 class PluginImpl(PluginV2):
     @classmethod
     def get_schema(cls) -> Dict[str, Any]:
-        return {
-            "$schema": "http://json-schema.org/draft-04/schema#",
-            "type": "object",
-            "additionalProperties": False,
-            "properties": {
-                "kdefconfig": {"type": "array", "default": ["defconfig"]},
-                "kconfigfile": {"type": "string", "default": None},
-                "kconfigflavour": {"type": "string", "default": ""},
-                "kconfigs": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-image-target": {
-                    "oneOf": [{"type": "string"}, {"type": "object"}],
-                    "default": "",
-                },
-                "kernel-with-firmware": {
-                    "type": "boolean",
-                    "default": True,
-                },
-                "kernel-device-trees": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-initrd-modules": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-initrd-configured-modules": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-initrd-firmware": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-initrd-compression": {
-                    "type": "string",
-                    "enum": ["lz4", "xz", "gz"],
-                },
-                "kernel-initrd-compression-options": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-initrd-channel": {
-                    "type": "string",
-                    "default": "stable",
-                },
-                "kernel-initrd-overlay": {
-                    "type": "string",
-                    "default": "",
-                },
-                "kernel-initrd-addons": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-build-efi-image": {
-                    "type": "boolean",
-                    "default": False,
-                },
-                "kernel-compiler": {
-                    "type": "string",
-                    "default": "",
-                },
-                "kernel-compiler-paths": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-compiler-parameters": {
-                    "type": "array",
-                    "minitems": 1,
-                    "uniqueItems": True,
-                    "items": {"type": "string"},
-                    "default": [],
-                },
-                "kernel-enable-zfs-support": {
-                    "type": "boolean",
-                    "default": False,
-                },
-                "kernel-enable-perf": {
-                    "type": "boolean",
-                    "default": False,
-                },
-            },
-        }
+        # callers update the returned schema, never hand out the module copy
+        return copy.deepcopy(_SCHEMA)
+
+    @classmethod
+    def validate_options(cls, options: Dict[str, Any]) -> None:
+        # raises jsonschema.ValidationError, never modifies options
+        _schema_validator().validate(options)
 
     def _init_build_env(self) -> None:
         # first get all the architectures, new v2 plugin is making life difficult
@@ -355,7 +590,7 @@ class PluginImpl(PluginV2):
         self._get_deb_architecture()
         self._get_kernel_architecture()
 
-        self.make_cmd = ["make", "-j$(nproc)"]
+        self.make_cmd = ["make", _MAKE_JOBS]
         # we are building out of tree, configure paths
         self.make_cmd.append("-C")
         self.make_cmd.append("${KERNEL_SRC}")
@@ -376,9 +611,26 @@ class PluginImpl(PluginV2):
             architecture=self.initrd_arch,
         )
 
-        self.snapd_snap = os.path.join(
-            "${SNAPCRAFT_PART_BUILD}", snapd_snap_file_name
+        # emitted verbatim into the build script, no need for os.path
+        self.snapd_snap = f"${{SNAPCRAFT_PART_BUILD}}/{snapd_snap_file_name}"
+
+        # pre-join initrd content lists used by the generated script
+        # modules are de-duplicated and sorted ignoring case, like `sort -fu`,
+        # keeping the first spelling given
+        initrd_modules = {}
+        for m in (
+            *self.options.kernel_initrd_modules,
+            *self.options.kernel_initrd_configured_modules,
+        ):
+            initrd_modules.setdefault(m.casefold(), m)
+        self._initrd_modules_str = " ".join(
+            shlex.quote(initrd_modules[k]) for k in sorted(initrd_modules)
+        )
+        self._initrd_configured_str = " ".join(
+            self.options.kernel_initrd_configured_modules
         )
+        self._initrd_firmware_str = " ".join(self.options.kernel_initrd_firmware)
+        self._initrd_addons_str = " ".join(self.options.kernel_initrd_addons)
 
     def _get_target_architecture(self) -> None:
         # self.target_arch = os.getenv("SNAPCRAFT_TARGET_ARCH")
@@ -386,75 +638,68 @@ class PluginImpl(PluginV2):
         # as work around check if we are cross building, to know what is
         # target arch
         self.target_arch = None
-        for i in range(1, len(sys.argv)):
-            if sys.argv[i].startswith("--target-arch="):
-                self.target_arch = sys.argv[i].split("=")[1]
-            elif sys.argv[i].startswith("--target-arch"):
-                self.target_arch = sys.argv[i+1]
+        args = sys.argv[1:]
+        for i, arg in enumerate(args):
+            if arg.startswith("--target-arch="):
+                self.target_arch = arg.partition("=")[2]
+                break
+            if arg == "--target-arch" and i + 1 < len(args):
+                self.target_arch = args[i + 1]
+                break
 
         if self.target_arch is None:
             # TDDO: there is bug in snapcraft, use uname
             # use ProjectOptions().deb_arch instead
             # self.target_arch = os.getenv("SNAP_ARCH")
-            self.target_arch = ProjectOptions().deb_arch
+            self.target_arch = _host_deb_arch()
 
         click.echo(f"Target architecture: {self.target_arch}")
 
     def _get_kernel_architecture(self) -> None:
-        if self.target_arch == "armhf":
-            self.kernel_arch = "arm"
-        elif self.target_arch == "arm64":
-            self.kernel_arch = "arm64"
-        elif self.target_arch == "riscv64":
-            self.kernel_arch = "riscv"
-        elif self.target_arch == "amd64":
-            self.kernel_arch = "x86"
-        else:
+        self.kernel_arch = _KERNEL_ARCH_MAP.get(self.target_arch)
+        if self.kernel_arch is None:
             click.echo("Unknown kernel architecture!!!")
 
     def _get_deb_architecture(self) -> None:
-        if self.target_arch == "armhf":
-            self.deb_arch = "armhf"
-        elif self.target_arch == "arm64":
-            self.deb_arch = "arm64"
-        elif self.target_arch == "riscv64":
-            self.deb_arch = "riscv64"
-        elif self.target_arch == "amd64":
-            self.deb_arch = "amd64"
-        else:
+        self.deb_arch = _DEB_ARCH_MAP.get(self.target_arch)
+        if self.deb_arch is None:
             click.echo("Unknown deb architecture!!!")
 
     def _check_cross_compilation(self) -> None:
-        host_arch = os.getenv("SNAP_ARCH")
-        if host_arch != self.target_arch:
+        if _HOST_ARCH != self.target_arch:
             click.echo(f"Configuring cross build to {self.kernel_arch}")
             self.make_cmd.append(f"ARCH={self.kernel_arch}")
             self.make_cmd.append("CROSS_COMPILE=${SNAPCRAFT_ARCH_TRIPLET}-")
 
     def _set_kernel_targets(self) -> None:
-        if not self.options.kernel_image_target:
-            self.kernel_image_target = default_kernel_image_target[self.deb_arch]
-        elif isinstance(self.options.kernel_image_target, str):
-            self.kernel_image_target = self.options.kernel_image_target
-        elif self.deb_arch in self.options.kernel_image_target:
-            self.kernel_image_target = self.options.kernel_image_target[self.deb_arch]
-
-        self.make_targets = [self.kernel_image_target, "modules"]
+        # fall back to the arch default if the target map does not cover it
+        image_target = self.options.kernel_image_target
+        default_target = default_kernel_image_target[self.deb_arch]
+        self.kernel_image_target = (
+            default_target
+            if not image_target
+            else image_target
+            if isinstance(image_target, str)
+            else image_target.get(self.deb_arch, default_target)
+        )
+
+        self.dtbs = [f"{i}.dtb" for i in self.options.kernel_device_trees]
+        # build all dtbs for the arch unless specific ones were requested
+        build_all_dtbs = not self.dtbs and self.kernel_arch in _DTB_ARCHES
+
+        self.make_targets = [
+            self.kernel_image_target,
+            "modules",
+            *self.dtbs,
+            *(["dtbs"] if build_all_dtbs else []),
+        ]
         self.make_install_targets = [
             "modules_install",
             "INSTALL_MOD_STRIP=1",
             "INSTALL_MOD_PATH=${SNAPCRAFT_PART_INSTALL}",
+            *(_DTBS_INSTALL_TARGETS if build_all_dtbs else []),
+            *self._get_fw_install_targets(),
         ]
-        self.dtbs = [f"{i}.dtb" for i in self.options.kernel_device_trees]
-        if self.dtbs:
-            self.make_targets.extend(self.dtbs)
-        elif self.kernel_arch in ("arm", "arm64", "riscv64"):
-            self.make_targets.append("dtbs")
-            self.make_install_targets.extend(
-                ["dtbs_install",
-                    "INSTALL_DTBS_PATH=${SNAPCRAFT_PART_INSTALL}/dtbs"]
-            )
-        self.make_install_targets.extend(self._get_fw_install_targets())
 
     def _get_fw_install_targets(self) -> List[str]:
         if not self.options.kernel_with_firmware:
@@ -465,116 +710,12 @@ class PluginImpl(PluginV2):
             "INSTALL_FW_PATH=${SNAPCRAFT_PART_INSTALL}/lib/firmware",
         ]
 
-    def _link_files_fnc_cmd(self) -> List[str]:
-        return [
-            " ".join(["# link files, accept wild cards"]),
-            " ".join(
-                ["# 1: reference dir, 2: file(s) including wild cards, 3: dst dir"]
-            ),
-            " ".join(["link_files() {"]),
-            " ".join(['\tif [ "${2}" = "*" ]; then']),
-            " ".join(["\t\tfor f in $(ls ${1})"]),
-            " ".join(["\t\tdo"]),
-            " ".join(["\t\t\tlink_files ${1} ${f} ${3}"]),
-            " ".join(["\t\tdone"]),
-            " ".join(["\t\treturn 0"]),
-            " ".join(["\tfi"]),
-            " ".join(["\tif [ -d ${1}/${2} ]; then"]),
-            " ".join(["\t\tfor f in $(ls ${1}/${2})"]),
-            " ".join(["\t\tdo"]),
-            " ".join(["\t\t\tlink_files ${1} ${2}/${f} ${3}"]),
-            " ".join(["\t\tdone"]),
-            " ".join(["\t\treturn 0"]),
-            " ".join(["\tfi"]),
-            " ".join([""]),
-            " ".join(['\tlocal found=""']),
-            " ".join(["\tfor f in $(ls ${1}/${2})"]),
-            " ".join(["\tdo"]),
-            " ".join(['\t\tif [[ -L "${f}" ]]; then']),
-            " ".join(
-                [
-                    "\t\t\tlocal rel_path=$(",
-                    "realpath",
-                    "--no-symlinks",
-                    "--relative-to=${1}",
-                    "${f}",
-                    ")",
-                ]
-            ),
-            " ".join(["\t\telse"]),
-            " ".join(
-                [
-                    "\t\t\tlocal rel_path=$(",
-                    "realpath",
-                    "-se",
-                    "--relative-to=${1}",
-                    "${f}",
-                    ")",
-                ]
-            ),
-            " ".join(["\t\tfi"]),
-            " ".join(["\t\tlocal dir_path=$(dirname ${rel_path})"]),
-            " ".join(["\t\tmkdir -p ${3}/${dir_path}"]),
-            " ".join(['\t\techo "installing ${f} to ${3}/${dir_path}"']),
-            " ".join(["\t\tln -f ${f} ${3}/${dir_path}"]),
-            " ".join(['\t\tfound="yes"']),
-            " ".join(["\tdone"]),
-            " ".join(['\tif [ "yes" = "${found}" ]; then']),
-            " ".join(["\t\treturn 0"]),
-            " ".join(["\telse"]),
-            " ".join(["\t\treturn 1"]),
-            " ".join(["\tfi"]),
-            " ".join(["}"]),
-        ]
-
-    def _download_core_initrd_fnc_cmd(self) -> List[str]:
-        return [
-            " ".join(["# Helper to download code initrd dep package"]),
-            " ".join(["# 1: tmp dir, 2: arch, 3: release, 4: output dir"]),
-            " ".join(["download_core_initrd() {"]),
-            " ".join(["\tlocal tmp_dir=${1}"]),
-            " ".join(["\tlocal dpkg_arch=${2}"]),
-            " ".join(["\tlocal release=${3}"]),
-            " ".join(["\tlocal output_dir=${4}"]),
-            " ".join(["\tlocal apt_dir=${tmp_dir}/apt"]),
-            " ".join(["\tlocal sources_p=${apt_dir}/ppa.list"]),
-            " ".join(["\tlocal stage_dir=${apt_dir}/stage"]),
-            " ".join(["\tlocal status_p=${stage_dir}/status"]),
-            " ".join(['\tmkdir -p "${stage_dir}"']),
-            " ".join(['\ttouch "${status_p}"']),
-            " ".join(['\tcat > "${sources_p}" <<EOF']),
-            " ".join(
-                ["deb https://ppa.launchpadcontent.net/snappy-dev/image/ubuntu ${release} main"]),
-            " ".join(["EOF"]),
-            " ".join(["\tlocal apt_options=("]),
-            " ".join(['\t\t"-o" "APT::Architecture=$dpkg_arch"']),
-            " ".join(['\t\t"-o" "APT::Get::AllowUnauthenticated=true"']),
-            " ".join(['\t\t"-o" "Acquire::AllowInsecureRepositories=true"']),
-            " ".join(['\t"-o" "Dir::Etc=${apt_dir}"']),
-            " ".join(['\t"-o" "Dir::Etc::sourcelist=$sources_p"']),
-            " ".join(['\t\t"-o" "Dir::Cache=$${stage_dir}/var/cache/apt"']),
-            " ".join(['\t\t'"-o" "Dir::State=${stage_dir}"]),
-            " ".join(['\t"-o" "Dir::State::status=$status_p"']),
-            " ".join(['\t\t"-o" "pkgCacheGen::Essential=none")']),
-            " ".join(["\tmkdir -p ${apt_dir}/preferences.d"]),
-            " ".join(['\tapt update "${apt_options[@]}"']),
-            " ".join(
-                ['\tapt download "${apt_options[@]}" ubuntu-core-initramfs']),
-            " ".join([""]),
-            " ".join(["# unpack dep to the target dir"]),
-            " ".join(["\tdpkg -x ubuntu-core-initramfs_*.deb ${output_dir}"]),
-            " ".join(["}"]),
-        ]
-
+    @functools.cached_property
     def _download_generic_initrd_cmd(self) -> List[str]:
         return [
-            " ".join(['echo "Geting ubuntu-core-initrd...."']),
+            'echo "Geting ubuntu-core-initrd...."',
             # only download u-c-initrd deb if needed
-            " ".join(
-                [
-                    "if [ ! -e ${UC_INITRD_DEB} ]; then",
-                ]
-            ),
+            "if [ ! -e ${UC_INITRD_DEB} ]; then",
             " ".join(
                 [
                     "\tdownload_core_initrd",
@@ -582,26 +723,85 @@ class PluginImpl(PluginV2):
                     self.initrd_arch,
                     self.u_series,
                     "${UC_INITRD_DEB}",
+                    *(
+                        [
+                            _download_cache_dir(
+                                f"ubuntu-core-initramfs {self.u_series} {self.initrd_arch}"
+                            )
+                        ]
+                        if self.options.kernel_download_cache
+                        else []
+                    ),
                 ]
             ),
-            " ".join(["fi"]),
+            "fi",
         ]
 
+    @functools.cached_property
     def _download_snapd_snap_cmd(self) -> List[str]:
-        cmd_download_snapd_snap = [
-            " ".join(['\techo "Downloading snapd snap from snap store"']),
-            " ".join(
-                [
-                    f"\tUBUNTU_STORE_ARCH={self.initrd_arch}",
-                    "snap",
-                    "download",
-                    _SNAPD_SNAP_NAME,
-                    "--channel",
-                    f"latest/{self.options.kernel_initrd_channel}",
-                    "--basename",
-                    f"$(basename {self.snapd_snap} | cut -f1 -d'.')",
-                ]
-            ),
+        cmd_snap_download = " ".join(
+            [
+                f"UBUNTU_STORE_ARCH={self.initrd_arch}",
+                "snap",
+                "download",
+                _SNAPD_SNAP_NAME,
+                "--channel",
+                f"latest/{self.options.kernel_initrd_channel}",
+                "--basename",
+                f"$(basename {self.snapd_snap} | cut -f1 -d'.')",
+            ]
+        )
+
+        if self.options.kernel_download_cache:
+            snapd_snap_cache_dir = _download_cache_dir(
+                " ".join(
+                    [
+                        _SNAPD_SNAP_NAME,
+                        f"latest/{self.options.kernel_initrd_channel}",
+                        self.initrd_arch,
+                    ]
+                )
+            )
+            snapd_snap_cache = os.path.join(
+                snapd_snap_cache_dir, os.path.basename(self.snapd_snap)
+            )
+            # snap download writes the assertion next to the snap, it carries
+            # the revision shown when the cached copy is reused
+            snapd_assert = f"{os.path.splitext(self.snapd_snap)[0]}.assert"
+            snapd_assert_cache = f"{os.path.splitext(snapd_snap_cache)[0]}.assert"
+            cmd_download_snapd_snap = [
+                f"\tif [ -f {snapd_snap_cache} ]; then",
+                " ".join(
+                    [
+                        '\t\techo "Using cached snapd snap revision',
+                        f"$(sed -n 's/^snap-revision: //p' {snapd_assert_cache} 2>/dev/null),",
+                        f'remove {snapd_snap_cache_dir} to refresh it"',
+                    ]
+                ),
+                f"\t\tcp {snapd_snap_cache} {self.snapd_snap}",
+                "\telse",
+                '\t\techo "Downloading snapd snap from snap store"',
+                f"\t\t{cmd_snap_download}",
+                # copy under a temporary name in the cache dir first, the
+                # rename is atomic so an interrupted copy is never picked up
+                f"\t\tmkdir -p {snapd_snap_cache_dir}",
+                f"\t\tcp {snapd_assert} {snapd_assert_cache}",
+                f"\t\tcp {self.snapd_snap} {snapd_snap_cache}.tmp",
+                f"\t\tmv {snapd_snap_cache}.tmp {snapd_snap_cache}",
+                "\tfi",
+            ]
+        else:
+            cmd_download_snapd_snap = [
+                '\techo "Downloading snapd snap from snap store"',
+                f"\t{cmd_snap_download}",
+            ]
+
+        return [
+            'echo "Geting snapd snap for snap bootstrap..."',
+            # only download again if files does not exist, otherwise
+            # assume we are re-running build
+            f"if [ ! -e {self.snapd_snap} ]; then",
+            *cmd_download_snapd_snap,
             " ".join(
                 [
                     "\tunsquashfs",
@@ -613,27 +813,21 @@ class PluginImpl(PluginV2):
                     "meta"
                 ]
             ),
-        ]
-
-        return [
-            " ".join(['echo "Geting snapd snap for snap bootstrap..."']),
-            # only download again if files does not exist, otherwise
-            # assume we are re-running build
             " ".join(
                 [
-                    f"if [ ! -e {self.snapd_snap} ]; then",
+                    '\techo "Using snapd version',
+                    "$(sed -n 's/^version: //p' ${SNAPD_UNPACKED_SNAP}/meta/snap.yaml)\"",
                 ]
             ),
-            *cmd_download_snapd_snap,
-            " ".join(["fi"]),
+            "fi",
         ]
 
     def _clone_zfs_cmd(self) -> List[str]:
         # clone zfs if needed
         if self.options.kernel_enable_zfs_support:
             return [
-                " ".join(["if [ ! -d ${SNAPCRAFT_PART_BUILD}/zfs ]; then"]),
-                " ".join(['\techo "clonning zfs..."']),
+                "if [ ! -d ${SNAPCRAFT_PART_BUILD}/zfs ]; then",
+                '\techo "clonning zfs..."',
                 " ".join(
                     [
                         "\tgit",
@@ -645,120 +839,82 @@ class PluginImpl(PluginV2):
                         "master",
                     ]
                 ),
-                " ".join(["fi"]),
+                "fi",
             ]
         return [
-            " ".join(['echo "zfs is not enabled"']),
+            'echo "zfs is not enabled"',
         ]
 
     def _make_initrd_cmd(self) -> List[str]:
-
-        cmd_echo = [
-            " ".join(
-                [
-                    "echo",
-                    '"Generating initrd with ko modules for kernel release: ${KERNEL_RELEASE}"',
-                ]
-            ),
-        ]
+        # module list is known here, write it out sorted and de-duplicated
+        cmd_write_modules_conf = []
+        if self._initrd_modules_str:
+            cmd_write_modules_conf = [
+                " ".join(
+                    [
+                        "printf '%s\\n'",
+                        self._initrd_modules_str,
+                        ">",
+                        "${initramfs_ko_modules_conf}",
+                    ]
+                ),
+            ]
 
         cmd_prepare_modules_feature = [
             # install required modules to initrd
-            " ".join(['echo "Installing ko modules to initrd..."']),
-            " ".join(['install_modules=""']),
-            " ".join(['echo "Gathering module dependencies..."']),
-            " ".join(['install_modules=""']),
-            " ".join(
-                ["uc_initrd_feature_kernel_modules=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/kernel-modules"]),
-            " ".join(["mkdir -p ${uc_initrd_feature_kernel_modules}"]),
-            " ".join(
-                ['initramfs_ko_modules_conf=${uc_initrd_feature_kernel_modules}/extra-kernel-modules.conf']),
-            " ".join(
-                [
-                    "for",
-                    "m",
-                    "in",
-                    f"{' '.join(self.options.kernel_initrd_modules)} {' '.join(self.options.kernel_initrd_configured_modules)}",
-                ]
-            ),
-            " ".join(["do"]),
+            'echo "Installing ko modules to initrd..."',
+            'install_modules=""',
+            'echo "Gathering module dependencies..."',
+            'install_modules=""',
+            "uc_initrd_feature_kernel_modules=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/kernel-modules",
+            "mkdir -p ${uc_initrd_feature_kernel_modules}",
+            'initramfs_ko_modules_conf=${uc_initrd_feature_kernel_modules}/extra-kernel-modules.conf',
+            *cmd_write_modules_conf,
+            'echo "Configuring ubuntu-core-initramfs.conf with supported modules"',
+            'echo "If modules is not included in initrd, do not include it"',
+            'initramfs_conf_dir=${uc_initrd_feature_kernel_modules}/usr/lib/modules-load.d',
+            'mkdir -p ${initramfs_conf_dir}',
+            "initramfs_conf=${initramfs_conf_dir}/ubuntu-core-initramfs.conf",
+            'echo "# configures modules" > ${initramfs_conf}',
+            f"for m in {self._initrd_configured_str}",
+            "do",
             " ".join(
                 [
-                    "\techo",
-                    "${m}",
-                    ">>",
-                    "${initramfs_ko_modules_conf}"
+                    "\tif [",
+                    "-n",
+                    '"$(modprobe -n -q --show-depends -d ${uc_initrd_feature_kernel_modules} -S "${KERNEL_RELEASE}" ${m})"',
+                    "]; then",
                 ]
             ),
-            " ".join(["done"]),
-            " ".join(
-                [
-                    "[",
-                    "-e",
-                    "${initramfs_ko_modules_conf}",
-                    "]",
-                    "&&",
-                    "sort",
-                    "-fu",
-                    "${initramfs_ko_modules_conf} -o ${initramfs_ko_modules_conf}",
-                ],
-            ),
+            "\t\techo ${m} >> ${initramfs_conf}",
+            "\tfi",
+            "done",
         ]
 
-        cmd_prepare_modules_feature.extend(
-            [
-                " ".join(
-                    [
-                        'echo "Configuring ubuntu-core-initramfs.conf with supported modules"'
-                    ]
-                ),
-                " ".join(
-                    ['echo "If modules is not included in initrd, do not include it"']
-                ),
-                " ".join(
-                    ['initramfs_conf_dir=${uc_initrd_feature_kernel_modules}/usr/lib/modules-load.d']),
-                " ".join(['mkdir -p ${initramfs_conf_dir}']),
-                " ".join(
-                    [
-                        "initramfs_conf=${initramfs_conf_dir}/ubuntu-core-initramfs.conf"
-                    ]
-                ),
-                " ".join(['echo "# configures modules" > ${initramfs_conf}']),
-                " ".join(
-                    [
-                        f"for m in {' '.join(self.options.kernel_initrd_configured_modules)}",
-                    ]
-                ),
-                " ".join(["do"]),
-                " ".join(
-                    [
-                        "\tif [",
-                        "-n",
-                        '"$(modprobe -n -q --show-depends -d ${uc_initrd_feature_kernel_modules} -S "${KERNEL_RELEASE}" ${m})"',
-                        "]; then",
-                    ]
-                ),
-                " ".join(["\t\techo ${m} >> ${initramfs_conf}"]),
-                " ".join(["\tfi"]),
-                " ".join(["done"]),
-            ]
-        )
-
         # gather firmware files
         cmd_prepare_initrd_overlay_feature = [
-            " ".join(['echo "Installing initrd overlay firmware..."']),
-            " ".join(
-                ["uc_initrd_feature_firmware=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/uc-firmware"]),
-            " ".join(["mkdir -p ${uc_initrd_feature_firmware}"]),
-            " ".join(
-                [f"for f in {' '.join(self.options.kernel_initrd_firmware)}"]
-            ),
-            " ".join(["do"]),
+            'echo "Installing initrd overlay firmware..."',
+            "uc_initrd_feature_firmware=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/uc-firmware",
+            "mkdir -p ${uc_initrd_feature_firmware}",
+            # link up to nproc firmware entries concurrently; each job's
+            # output is collected and printed in one go so entries do not
+            # interleave. Missing firmware is not fatal, the jobs always
+            # succeed, so they are only waited for to bound the concurrency
+            "fw_jobs=$(nproc)",
+            "fw_pids=()",
+            f"for f in {self._initrd_firmware_str}",
+            "do",
+            "\tif [ ${#fw_pids[@]} -ge ${fw_jobs} ]; then",
+            "\t\twait ${fw_pids[0]}",
+            '\t\tfw_pids=("${fw_pids[@]:1}")',
+            "\tfi",
+            "\t{",
+            "\t\tfw_log=$(",
             # firmware can be from kernel build or from stage
             # firmware from kernel build takes preference
             " ".join(
                 [
-                    "\tif !",
+                    "\t\t\tif !",
                     "link_files",
                     "${SNAPCRAFT_PART_INSTALL}",
                     "${f}",
@@ -769,7 +925,7 @@ class PluginImpl(PluginV2):
             ),
             " ".join(
                 [
-                    "\t\tif !",
+                    "\t\t\t\tif !",
                     "link_files",
                     "${SNAPCRAFT_STAGE}",
                     "${f}",
@@ -778,20 +934,19 @@ class PluginImpl(PluginV2):
                     "then",
                 ]
             ),
-            " ".join(['\t\t\techo "Missing firmware [${f}], ignoring it"']),
-            " ".join(["\t\tfi"]),
-            " ".join(["\tfi"]),
-            " ".join(["done"]),
+            '\t\t\t\t\techo "Missing firmware [${f}], ignoring it"',
+            "\t\t\t\tfi",
+            "\t\t\tfi 2>&1",
+            "\t\t)",
+            '\t\techo "${fw_log}"',
+            "\t} &",
+            "\tfw_pids+=($!)",
+            "done",
+            "wait",
+            "",
+            "uc_initrd_feature_overlay=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/uc-overlay",
+            "mkdir -p ${uc_initrd_feature_overlay}",
         ]
-
-        cmd_prepare_initrd_overlay_feature.extend(
-            [
-                " ".join(""),
-                " ".join(
-                    ["uc_initrd_feature_overlay=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/uc-overlay"]),
-                " ".join(["mkdir -p ${uc_initrd_feature_overlay}"]),
-            ]
-        )
         # apply overlay if defined
         if self.options.kernel_initrd_overlay:
             cmd_prepare_initrd_overlay_feature.extend(
@@ -804,7 +959,7 @@ class PluginImpl(PluginV2):
                             "${uc_initrd_feature_overlay}",
                         ]
                     ),
-                    " ".join([""]),
+                    "",
                 ]
             )
 
@@ -812,11 +967,9 @@ class PluginImpl(PluginV2):
         if self.options.kernel_initrd_addons:
             cmd_prepare_initrd_overlay_feature.extend(
                 [
-                    " ".join(['echo "Installing initrd addons..."']),
-                    " ".join(
-                        [f"for a in {' '.join(self.options.kernel_initrd_addons)}"]
-                    ),
-                    " ".join(["do"]),
+                    'echo "Installing initrd addons..."',
+                    f"for a in {self._initrd_addons_str}",
+                    "do",
                     " ".join(
                         [
                             "\techo",
@@ -831,118 +984,48 @@ class PluginImpl(PluginV2):
                             "${uc_initrd_feature_overlay}",
                         ]
                     ),
-                    " ".join(["done"]),
+                    "done",
                 ],
             )
 
-        cmd_prepare_snap_bootstrap_feature = [
-            # install selected snap bootstrap
-            " ".join(['echo "Preparing snap-boostrap initrd feature..."']),
-            " ".join(
-                ["uc_initrd_feature_snap_bootstratp=${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/snap-bootstrap"]),
-            " ".join(["mkdir -p ${uc_initrd_feature_snap_bootstratp}"]),
-            " ".join(
-                [
-                    "link_files",
-                    "${SNAPD_UNPACKED_SNAP}",
-                    "usr/lib/snapd/snap-bootstrap",
-                    "${uc_initrd_feature_snap_bootstratp}",
-                ]
-            ),
-            " ".join(
-                [
-                    "link_files",
-                    "${SNAPD_UNPACKED_SNAP}",
-                    "usr/lib/snapd/info",
-                    "${uc_initrd_feature_snap_bootstratp}",
-                ]
-            ),
-            " ".join(
-                [
-                    "cp",
-                    "${SNAPD_UNPACKED_SNAP}/usr/lib/snapd/info",
-                    "${SNAPCRAFT_PART_INSTALL}/snapd-info",
-                ]
-            )
-        ]
-
-        cmd_create_initrd = [
-            " ".join(
-                [
-                    "if compgen -G  ${SNAPCRAFT_PART_INSTALL}/initrd.img* > ",
-                    "/dev/null; then",
-                ]
-            ),
-            " ".join(["\trm -rf ${SNAPCRAFT_PART_INSTALL}/initrd.img*"]),
-            " ".join(["fi"]),
-        ]
-
-        cmd_create_initrd.extend(
-            [
-                " ".join([""]),
-                " ".join([""]),
-                " ".join(
-                    ["ubuntu_core_initramfs=${UC_INITRD_DEB}/usr/bin/ubuntu-core-initramfs"]),
-            ],
-        )
-
         # ubuntu-core-initramfs does not support configurable compression command
         # we still want to support this as configurable option though.
-        comp_command = self._compression_cmd()
+        comp_command = self._compression_cmd
+        cmd_update_compression = []
         if comp_command:
-            cmd_create_initrd.extend(
-                [
-                    " ".join([""]),
-                    " ".join(
-                        [
-                            "echo",
-                            '"Updating compression command to be used for initrd"',
-                        ],
-                    ),
-                    " ".join(
-                        [
-                            "sed",
-                            "-i",
-                            f"'s/lz4 -9 -l/{comp_command}/g'",
-                            "${ubuntu_core_initramfs}",
-                        ],
-                    ),
-                ]
-            )
-        cmd_create_initrd.extend(
-            [
-                " ".join(['echo "Workaround for bug in ubuntu-core-initramfs"']),
+            cmd_update_compression = [
+                "",
                 " ".join(
                     [
-                        "for",
-                        "feature",
-                        "in",
-                        "kernel-modules",
-                        "snap-bootstrap",
-                        "uc-firmware",
-                        "uc-overlay",
+                        "echo",
+                        '"Updating compression command to be used for initrd"',
                     ],
                 ),
-                " ".join(["do"]),
                 " ".join(
                     [
-                        "\tlink_files",
-                        "${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/${feature}",
-                        '"*"',
-                        "${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/main"
+                        "sed",
+                        "-i",
+                        f"'s/lz4 -9 -l/{comp_command}/g'",
+                        "${ubuntu_core_initramfs}",
                     ],
                 ),
-                " ".join(["done"]),
-                " ".join([""]),
-            ],
-        )
+            ]
+
+        cmd_create_initrd = [
+            "rm -rf ${SNAPCRAFT_PART_INSTALL}/initrd.img*",
+            "",
+            "",
+            "ubuntu_core_initramfs=${UC_INITRD_DEB}/usr/bin/ubuntu-core-initramfs",
+            *cmd_update_compression,
+            *_LINK_FILES_WORKAROUND_CMD,
+            "",
+        ]
 
         if self.options.kernel_build_efi_image:
             cmd_create_initrd.extend(
                 [
-                    " ".join([""]),
-                    " ".join(
-                        ["stub_p=$(find ${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/efi/ -maxdepth 1 -name 'linux*.efi.stub' -printf '%f\n')"]),
+                    "",
+                    "stub_p=$(find ${UC_INITRD_DEB}/usr/lib/ubuntu-core-initramfs/efi/ -maxdepth 1 -name 'linux*.efi.stub' -printf '%f\n')",
                     " ".join(
                         [
                             "${ubuntu_core_initramfs}",
@@ -970,7 +1053,7 @@ class PluginImpl(PluginV2):
         else:
             cmd_create_initrd.extend(
                 [
-                    " ".join([""]),
+                    "",
                     " ".join(
                         [
                             "${ubuntu_core_initramfs}",
@@ -1004,55 +1087,52 @@ class PluginImpl(PluginV2):
             )
 
         return [
-            *cmd_echo,
+            'echo "Generating initrd with ko modules for kernel release: ${KERNEL_RELEASE}"',
             *cmd_prepare_modules_feature,
-            " ".join([""]),
+            "",
             *cmd_prepare_initrd_overlay_feature,
-            " ".join([""]),
-            *cmd_prepare_snap_bootstrap_feature,
-            " ".join([""]),
-            " ".join(['echo "Create new initrd..."']),
+            "",
+            *_SNAP_BOOTSTRAP_FEATURE_CMD,
+            "",
+            'echo "Create new initrd..."',
             *cmd_create_initrd,
         ]
 
+    @functools.cached_property
     def _compression_cmd(self) -> str:
-        if not self.options.kernel_initrd_compression:
+        compression = self.options.kernel_initrd_compression
+        if not compression:
             return
-        compressor = _compression_command[self.options.kernel_initrd_compression]
+        compressor = _compression_command[compression]
         options = ""
         if self.options.kernel_initrd_compression_options:
             for opt in self.options.kernel_initrd_compression_options:
                 options = f"{options} {opt}"
         else:
-            options = _compressor_options[self.options.kernel_initrd_compression]
+            options = _compressor_options[compression]
 
         cmd = f"{compressor} {options}"
         click.echo(
             f"WARNING: Using custom initrd compressions command: {cmd!r}")
+        if compression == "zstd":
+            click.echo(
+                "WARNING: zstd initrd needs CONFIG_RD_ZSTD, kernel 5.9 or later")
         return cmd
 
+    @functools.cached_property
     def _parse_kernel_release_cmd(self) -> List[str]:
         return [
-            " ".join(['echo "Parsing created kernel release..."']),
-            " ".join(
-                [
-                    "KERNEL_RELEASE=$(cat ${SNAPCRAFT_PART_BUILD}/include/config/kernel.release)",
-                ]
-            ),
+            'echo "Parsing created kernel release..."',
+            "KERNEL_RELEASE=$(cat ${SNAPCRAFT_PART_BUILD}/include/config/kernel.release)",
         ]
 
+    @functools.cached_property
     def _copy_vmlinuz_cmd(self) -> List[str]:
         cmd = [
-            " ".join(['echo "Copying kernel image..."']),
+            'echo "Copying kernel image..."',
             # if kernel already exists, replace it, we are probably re-runing
             # build
-            " ".join(
-                [
-                    "[ -e ${SNAPCRAFT_PART_INSTALL}/kernel.img ]",
-                    "&&",
-                    "rm -rf ${SNAPCRAFT_PART_INSTALL}/kernel.img",
-                ]
-            ),
+            "rm -rf ${SNAPCRAFT_PART_INSTALL}/kernel.img",
             " ".join(
                 [
                     "ln",
@@ -1072,16 +1152,11 @@ class PluginImpl(PluginV2):
         ]
         return cmd
 
+    @functools.cached_property
     def _copy_system_map_cmd(self) -> List[str]:
         cmd = [
-            " ".join(['echo "Copying System map..."']),
-            " ".join(
-                [
-                    "[ -e ${SNAPCRAFT_PART_INSTALL}/System.map ]",
-                    "&&",
-                    "rm -rf ${SNAPCRAFT_PART_INSTALL}/System.map*",
-                ]
-            ),
+            'echo "Copying System map..."',
+            "rm -rf ${SNAPCRAFT_PART_INSTALL}/System.map*",
             " ".join(
                 [
                     "ln",
@@ -1095,58 +1170,34 @@ class PluginImpl(PluginV2):
 
     def _copy_dtbs_cmd(self) -> List[str]:
         if not self.options.kernel_device_trees:
-            return [" ".join([""])]
-
-        cmd = [
-            " ".join(['echo "Copying custom dtbs..."']),
-            " ".join(["mkdir -p ${SNAPCRAFT_PART_INSTALL}/dtbs"]),
-        ]
-        for dtb in self.dtbs:
-            # Strip any subdirectories
-            subdir_index = dtb.rfind("/")
-            if subdir_index > 0:
-                install_dtb = dtb[subdir_index + 1:]
-            else:
-                install_dtb = dtb
+            return [""]
 
-            cmd.extend(
+        return [
+            'echo "Copying custom dtbs..."',
+            "mkdir -p ${SNAPCRAFT_PART_INSTALL}/dtbs",
+            # link all dtbs with a single ln, using -t drops any subdirectories
+            # from the installed names
+            " ".join(
                 [
-                    " ".join(
-                        [
-                            "ln -f",
-                            f"${{KERNEL_BUILD_ARCH_DIR}}/dts/{dtb}",
-                            f"${{SNAPCRAFT_PART_INSTALL}}/dtbs/{install_dtb}",
-                        ]
-                    ),
+                    "ln -f -t ${SNAPCRAFT_PART_INSTALL}/dtbs",
+                    *(f"${{KERNEL_BUILD_ARCH_DIR}}/dts/{dtb}" for dtb in self.dtbs),
                 ]
-            )
-        return cmd
+            ),
+        ]
 
+    @functools.cached_property
     def _assemble_ubuntu_config_cmd(self) -> List[str]:
         flavour = self.options.kconfigflavour
         click.echo(f"Using ubuntu config flavour {flavour}")
         cmd = [
-            " ".join(['\techo "Assembling Ubuntu config..."']),
-            " ".join(
-                [
-                    "\t"
-                    "branch=$(cut -d'.' -f 2- < ${KERNEL_SRC}/debian/debian.env)",
-                ]
-            ),
-            " ".join(
-                ["\tbaseconfigdir=${KERNEL_SRC}/debian.${branch}/config"]),
-            " ".join(
-                [
-                    "\tarchconfigdir=${KERNEL_SRC}/debian.${branch}/config/${DEB_ARCH}"
-                ]
-            ),
-            " ".join(["\tcommonconfig=${baseconfigdir}/config.common.ports"]),
-            " ".join(["\tubuntuconfig=${baseconfigdir}/config.common.ubuntu"]),
-            " ".join(
-                ["\tarchconfig=${archconfigdir}/config.common.${DEB_ARCH}"]),
-            " ".join(
-                [f"\tflavourconfig=${{archconfigdir}}/config.flavour.{flavour}"]
-            ),
+            '\techo "Assembling Ubuntu config..."',
+            "\tbranch=$(cut -d'.' -f 2- < ${KERNEL_SRC}/debian/debian.env)",
+            "\tbaseconfigdir=${KERNEL_SRC}/debian.${branch}/config",
+            "\tarchconfigdir=${KERNEL_SRC}/debian.${branch}/config/${DEB_ARCH}",
+            "\tcommonconfig=${baseconfigdir}/config.common.ports",
+            "\tubuntuconfig=${baseconfigdir}/config.common.ubuntu",
+            "\tarchconfig=${archconfigdir}/config.common.${DEB_ARCH}",
+            f"\tflavourconfig=${{archconfigdir}}/config.flavour.{flavour}",
             " ".join(
                 [
                     "\tcat",
@@ -1165,8 +1216,8 @@ class PluginImpl(PluginV2):
         # if the parts build dir already contains a .config file,
         # use it
         cmd = [
-            " ".join(['echo "Preparing config..."']),
-            " ".join(["if [ ! -e ${SNAPCRAFT_PART_BUILD}/.config ]; then"]),
+            'echo "Preparing config..."',
+            "if [ ! -e ${SNAPCRAFT_PART_BUILD}/.config ]; then",
         ]
 
         # if kconfigfile is provided use that
@@ -1186,24 +1237,22 @@ class PluginImpl(PluginV2):
                 ],
             )
         elif self.options.kconfigflavour:
-            cmd.extend(self._assemble_ubuntu_config_cmd())
+            cmd.extend(self._assemble_ubuntu_config_cmd)
         else:
             # we need to run this with -j1, unit tests are a good defense here.
-            make_cmd = self.make_cmd.copy()
-            make_cmd[1] = "-j1"
             cmd.extend(
                 [
                     " ".join(
                         [
                             "\t",
-                            " ".join(make_cmd),
+                            " ".join(self._make_cmd_j1),
                             " ".join(self.options.kdefconfig),
                         ]
                     ),
                 ]
             )
         # close if statement
-        cmd.extend([" ".join(["fi"])])
+        cmd.extend(["fi"])
         return cmd
 
     def _do_patch_config_cmd(self) -> List[str]:
@@ -1212,39 +1261,23 @@ class PluginImpl(PluginV2):
         #  - read current .config and append
         #  - write out to disk
         if not self.options.kconfigs:
-            return [" ".join([])]
+            return [""]
 
-        config = "\n".join(self.options.kconfigs)
+        config = " ".join(shlex.quote(c) for c in self.options.kconfigs)
 
         # note that prepending and appending the overrides seems
         # only way to convince all kbuild versions to pick up the
         # configs during oldconfig in .config
         return [
-            " ".join(['echo "Appling extra config...."']),
-            " ".join(
-                [
-                    f"echo '{config}'",
-                    ">",
-                    "${SNAPCRAFT_PART_BUILD}/.config_snap",
-                ]
-            ),
-            " ".join(
-                [
-                    "cat",
-                    "${SNAPCRAFT_PART_BUILD}/.config",
-                    ">>",
-                    "${SNAPCRAFT_PART_BUILD}/.config_snap",
-                ]
-            ),
-            " ".join(
-                [
-                    f"echo '{config}'",
-                    ">>",
-                    "${SNAPCRAFT_PART_BUILD}/.config_snap",
-                ]
-            ),
+            'echo "Appling extra config...."',
+            "{",
+            f"\tprintf '%s\\n' {config}",
+            "\tcat ${SNAPCRAFT_PART_BUILD}/.config",
+            f"\tprintf '%s\\n' {config}",
             " ".join(
                 [
+                    "} > ${SNAPCRAFT_PART_BUILD}/.config_snap",
+                    "&&",
                     "mv",
                     "${SNAPCRAFT_PART_BUILD}/.config_snap",
                     "${SNAPCRAFT_PART_BUILD}/.config",
@@ -1253,146 +1286,86 @@ class PluginImpl(PluginV2):
         ]
 
     def _do_remake_config_cmd(self) -> List[str]:
-        # update config to include kconfig amendments using oldconfig
-        make_cmd = self.make_cmd.copy()
-        make_cmd[1] = "-j1"
+        # update config to include kconfig amendments using olddefconfig,
+        # which takes the default for every new option like `yes "" | oldconfig`
         return [
-            " ".join(['echo "Remaking oldconfig...."']),
-            " ".join(
-                [
-                    "bash -c ' yes \"\"",
-                    "|| true'",
-                    f"| {' '.join(make_cmd)} oldconfig",
-                ]
-            ),
+            'echo "Remaking oldconfig...."',
+            " ".join([*self._make_cmd_j1, "olddefconfig"]),
         ]
 
     def _get_configure_command(self) -> List[str]:
         return [
             *self._do_base_config_cmd(),
-            " ".join(["\n"]),
+            "\n",
             *self._do_patch_config_cmd(),
-            " ".join([""]),
+            "",
             *self._do_remake_config_cmd(),
         ]
 
     def _call_check_config_cmd(self) -> List[str]:
+        # check the resulting .config has all the necessary options and that
+        # boot essential ones are builtin or part of initrd; done in awk so
+        # the build does not need a python interpreter with snapcraft
+        def awk_str(text: str) -> str:
+            # the program is passed in single quotes, those cannot be escaped
+            assert "'" not in text, text
+            text = text.replace("\\", "\\\\").replace('"', '\\"')
+            return '"{}"'.format(text.replace("\n", "\\n"))
+
+        # boot options may be modules only if they are added to the initrd
+        boot_checks = []
+        for code, opt in _REQUIRED_BOOT_OPTS:
+            tables = ["builtin"]
+            if code in self.options.kernel_initrd_modules:
+                tables.append("modules")
+            cond = " && ".join(f'!("{opt}" in {table})' for table in tables)
+            boot_checks.append(
+                f'\tif ({cond}) boot_missing = boot_missing "{opt}\\n"'
+            )
+
         return [
-            " ".join(['echo "Checking config for expected options..."']),
-            " ".join(
-                [
-                    sys.executable,
-                    "-I",
-                    os.path.abspath(__file__),
-                    "check-new-config",
-                    "--config-path",
-                    "${SNAPCRAFT_PART_BUILD}/.config",
-                ]
+            'echo "Checking config for expected options..."',
+            "awk -F= '",
+            # ignore trailing whitespace and CRs on .config lines
+            '{ sub(/[ \\t\\r]+$/, "") }',
+            '$2 == "y" || $2 == "Y" { builtin[$1] = 1 }',
+            '$2 == "m" || $2 == "M" { modules[$1] = 1 }',
+            "END {",
+            *(
+                f"\tnotes[{awk_str(opt)}] = {awk_str(note)}"
+                for opt, note in _OPT_NOTES.items()
             ),
+            f'\tn = split("{" ".join(_REQUIRED_OPTS)}", required, " ")',
+            "\tfor (i = 1; i <= n; i++)",
+            "\t\tif (!(required[i] in builtin) && !(required[i] in modules))",
+            '\t\t\tmissing = missing required[i] " " notes[required[i]] "\\n"',
+            "\tif (missing != \"\")",
+            f'\t\tprintf "\\n%s\\n%s\\n", {awk_str(_MISSING_OPTS_WARNING)}, missing',
+            *boot_checks,
+            "\tif (boot_missing != \"\")",
+            f'\t\tprintf "\\n%s\\n%s\\n", {awk_str(_MISSING_BOOT_OPTS_WARNING)}, boot_missing',
+            "}' ${SNAPCRAFT_PART_BUILD}/.config",
         ]
 
-    def check_new_config(self, config_path: str):
-        click.echo("Checking created config...")
-        builtin, modules = self._do_parse_config(config_path)
-        self._do_check_config(builtin, modules)
-        self._do_check_initrd(builtin, modules)
-
-    def _do_parse_config(self, config_path: str):
-        builtin = []
-        modules = []
-        # tokenize .config and store options in builtin[] or modules[]
-        with open(config_path, encoding="utf8") as f:
-            for line in f:
-                tok = line.strip().split("=")
-                items = len(tok)
-                if items == 2:
-                    opt = tok[0].upper()
-                    val = tok[1].upper()
-                    if val == "Y":
-                        builtin.append(opt)
-                    elif val == "M":
-                        modules.append(opt)
-        return builtin, modules
-
-    def _do_check_config(self, builtin: List[str], modules: List[str]):
-        # check the resulting .config has all the necessary options
-        msg = (
-            "**** WARNING **** WARNING **** WARNING **** WARNING ****\n"
-            "Your kernel config is missing some features that Ubuntu Core "
-            "recommends or requires.\n"
-            "While we will not prevent you from building this kernel snap, "
-            "we suggest you take a look at these:\n"
-        )
-        required_opts = (
-            required_generic + required_security + required_snappy + required_systemd
-        )
-        missing = []
-
-        for code in required_opts:
-            opt = f"CONFIG_{code}"
-            if opt in builtin or opt in modules:
-                continue
-            missing.append(opt)
-
-        if missing:
-            warn = f"\n{msg}\n"
-            for opt in missing:
-                note = ""
-                if opt == "CONFIG_CC_STACKPROTECTOR_STRONG":
-                    note = "(4.1.x and later versions only)"
-                elif opt == "CONFIG_DEVPTS_MULTIPLE_INSTANCES":
-                    note = "(4.8.x and earlier versions only)"
-                warn += f"{opt} {note}\n"
-            click.echo(warn)
-
-    def _do_check_initrd(self, builtin: List[str], modules: List[str]):
-        # check all required_boot[] items are either builtin or part of initrd
-        msg = (
-            "**** WARNING **** WARNING **** WARNING **** WARNING ****\n"
-            "The following features are deemed boot essential for\n"
-            "ubuntu core, consider making them static[=Y] or adding\n"
-            "the corresponding module to initrd:\n"
-        )
-        missing = []
-
-        for code in required_boot:
-            opt = f"CONFIG_{code.upper()}"
-            if opt in builtin:
-                continue
-            if opt in modules and code in self.options.kernel_initrd_modules:
-                continue
-            missing.append(opt)
-
-        if missing:
-            warn = f"\n{msg}\n"
-            for opt in missing:
-                warn += f"{opt}\n"
-            click.echo(warn)
-
     def _clean_old_build_cmd(self) -> List[str]:
         return [
-            " ".join([""]),
-            " ".join(['echo "Cleaning previous build first..."']),
-            " ".join(
-                [
-                    "[ -e ${SNAPCRAFT_PART_INSTALL}/modules ]",
-                    "&&",
-                    "rm -rf ${SNAPCRAFT_PART_INSTALL}/modules",
-                ]
-            ),
+            "",
+            'echo "Cleaning previous build first..."',
+            "rm -rf ${SNAPCRAFT_PART_INSTALL}/modules",
+            # only drop the convenience symlink, never a real modules tree
             " ".join(
                 [
                     "[ -L ${SNAPCRAFT_PART_INSTALL}/lib/modules ]",
                     "&&",
-                    "rm -rf ${SNAPCRAFT_PART_INSTALL}/lib/modules",
+                    "rm -f ${SNAPCRAFT_PART_INSTALL}/lib/modules",
                 ]
             ),
         ]
 
     def _arrange_install_dir_cmd(self) -> List[str]:
         return [
-            " ".join([""]),
-            " ".join(['echo "Finalizing install directory..."']),
+            "",
+            'echo "Finalizing install directory..."',
             # upstream kernel installs under $INSTALL_MOD_PATH/lib/modules/
             # but snapd expects modules/ and firmware/
             " ".join(
@@ -1421,11 +1394,13 @@ class PluginImpl(PluginV2):
                     "${SNAPCRAFT_PART_INSTALL}",
                 ]
             ),
-            # create sym links for modules and firmware for convenience
+            # create sym links for modules and firmware for convenience,
+            # -T replaces a link left by a previous build instead of
+            # creating a new one inside the directory it points to
             " ".join(
                 [
                     "ln",
-                    "-sf",
+                    "-sfT",
                     "../modules",
                     "${SNAPCRAFT_PART_INSTALL}/lib/modules",
                 ]
@@ -1433,7 +1408,7 @@ class PluginImpl(PluginV2):
             " ".join(
                 [
                     "ln",
-                    "-sf",
+                    "-sfT",
                     "../firmware",
                     "${SNAPCRAFT_PART_INSTALL}/lib/firmware",
                 ]
@@ -1443,8 +1418,8 @@ class PluginImpl(PluginV2):
     def _install_config_cmd(self) -> List[str]:
         # install .config as config-$version
         return [
-            " ".join([""]),
-            " ".join(['echo "Installing kernel config..."']),
+            "",
+            'echo "Installing kernel config..."',
             " ".join(
                 [
                     "ln",
@@ -1466,6 +1441,12 @@ class PluginImpl(PluginV2):
         if self.options.kernel_compiler_parameters:
             for opt in self.options.kernel_compiler_parameters:
                 self.make_cmd.append(str(opt))
+        # config targets run serially, shared and never mutated; only the
+        # plugin's own job count is replaced, a -jN passed through
+        # kernel-compiler-parameters comes later and still takes effect
+        self._make_cmd_j1 = [
+            "-j1" if arg == _MAKE_JOBS else arg for arg in self.make_cmd
+        ]
 
     def get_build_snaps(self) -> Set[str]:
         return set()
@@ -1482,6 +1463,8 @@ class PluginImpl(PluginV2):
             "lz4",
             "curl",
         }
+        if self.options.kernel_initrd_compression == "zstd":
+            build_packages |= {"zstd"}
         if self.options.kernel_enable_zfs_support:
             build_packages |= {
                 "autoconf",
@@ -1508,75 +1491,71 @@ class PluginImpl(PluginV2):
         }
 
         # check if there is custom path to be included
+        # prepended in the listed order, earlier entries take precedence
         if self.options.kernel_compiler_paths:
-            for p in self.options.kernel_compiler_paths:
-                custom_path = "{}{}:".format(
-                    os.path.join("${SNAPCRAFT_STAGE}", p), custom_path
-                )
-            env["PATH"] = (f"{self.custom_path}:$PATH")
+            parts = [
+                os.path.join("${SNAPCRAFT_STAGE}", p)
+                for p in self.options.kernel_compiler_paths
+            ]
+            env["PATH"] = os.pathsep.join([*parts, "$PATH"])
 
         if "MAKEFLAGS" in os.environ:
-            makeflags = re.sub(r"-I[\S]*", "", os.environ["MAKEFLAGS"])
+            makeflags = _MAKEFLAGS_INCLUDE_RE.sub("", os.environ["MAKEFLAGS"])
             env["MAKEFLAGS"] = makeflags
 
         return env
 
     def _get_build_command(self) -> List[str]:
         return [
-            " ".join(['echo "Building kernel..."']),
+            'echo "Building kernel..."',
             " ".join(self.make_cmd + self.make_targets),
         ]
 
     def _get_post_install_cmd(self) -> List[str]:
         return [
-            " ".join(["\n"]),
-            *self._parse_kernel_release_cmd(),
-            " ".join(["\n"]),
-            *self._copy_vmlinuz_cmd(),
-            " ".join([""]),
-            *self._copy_system_map_cmd(),
-            " ".join([""]),
+            "\n",
+            *self._parse_kernel_release_cmd,
+            "\n",
+            *self._copy_vmlinuz_cmd,
+            "",
+            *self._copy_system_map_cmd,
+            "",
             *self._copy_dtbs_cmd(),
-            " ".join([""]),
+            "",
             *self._make_initrd_cmd(),
-            " ".join([""]),
+            "",
         ]
 
     def _get_install_command(self) -> List[str]:
         # install to installdir
-        cmd = [
-            " ".join(['echo "Installing kernel build..."']),
+        return [
+            'echo "Installing kernel build..."',
             " ".join(
-                self.make_cmd
-                + ["CONFIG_PREFIX=${SNAPCRAFT_PART_INSTALL}"]
-                + self.make_install_targets
+                [
+                    *self.make_cmd,
+                    "CONFIG_PREFIX=${SNAPCRAFT_PART_INSTALL}",
+                    *self.make_install_targets,
+                ]
             ),
+            # add post install steps
+            *self._get_post_install_cmd(),
+            # install .config as config-$version
+            *self._install_config_cmd(),
+            *self._arrange_install_dir_cmd(),
         ]
 
-        # add post install steps
-        cmd.extend(
-            self._get_post_install_cmd(),
-        )
-
-        # install .config as config-$version
-        cmd.extend(self._install_config_cmd())
-
-        cmd.extend(self._arrange_install_dir_cmd())
-
-        return cmd
-
     def _get_zfs_build_commands(self) -> List[str]:
         # include zfs build steps if required
         if self.options.kernel_enable_zfs_support:
             return [
-                " ".join(['echo "Building zfs modules..."']),
+                'echo "Building zfs modules..."',
                 " ".join(
                     [
                         "cd",
                         "${SNAPCRAFT_PART_BUILD}/zfs",
                     ]
                 ),
-                " ".join(["./autogen.sh"]),
+                "./autogen.sh",
                 " ".join(
                     [
                         "./configure",
@@ -1586,16 +1565,15 @@ class PluginImpl(PluginV2):
                         "--host=${SNAPCRAFT_ARCH_TRIPLET}",
                     ]
                 ),
-                " ".join(["make -j$(nproc)"]),
+                "make -j$(nproc)",
                 " ".join(
                     [
-                        "make",
+                        "make -j$(nproc)",
                         "install",
                         "DESTDIR=${SNAPCRAFT_PART_INSTALL}/zfs",
                     ]
                 ),
-                " ".join(
-                    ['release_version="$(ls ${SNAPCRAFT_PART_INSTALL}/modules)"']),
+                'release_version="$(ls ${SNAPCRAFT_PART_INSTALL}/modules)"',
                 " ".join(
                     [
                         "mv",
@@ -1610,12 +1588,11 @@ class PluginImpl(PluginV2):
                         "${SNAPCRAFT_PART_INSTALL}/zfs",
                     ]
                 ),
-                " ".join(['echo "Rebuilding module dependencies"']),
-                " ".join(
-                    ["depmod -b ${SNAPCRAFT_PART_INSTALL} ${release_version}"]),
+                'echo "Rebuilding module dependencies"',
+                "depmod -b ${SNAPCRAFT_PART_INSTALL} ${release_version}",
             ]
         return [
-            " ".join(['echo "Not building zfs modules"']),
+            'echo "Not building zfs modules"',
         ]
 
     def _get_perf_build_commands(self) -> List[str]:
@@ -1655,37 +1632,36 @@ class PluginImpl(PluginV2):
         self._configure_compiler()
         # kernel source can be either SNAPCRAFT_PART_SRC or SNAPCRAFT_PROJECT_DIR
         return [
-            " ".join(
-                ['[ -d ${SNAPCRAFT_PART_SRC}/kernel ] && KERNEL_SRC=${SNAPCRAFT_PART_SRC} || KERNEL_SRC=${SNAPCRAFT_PROJECT_DIR}']),
-            " ".join(['echo "PATH=$PATH"']),
-            " ".join(['echo "KERNEL_SRC=${KERNEL_SRC}"']),
-            " ".join([""]),
-            *self._link_files_fnc_cmd(),
-            " ".join([""]),
-            *self._download_core_initrd_fnc_cmd(),
-            " ".join([""]),
-            " ".join([""]),
-            *self._download_generic_initrd_cmd(),
-            " ".join([""]),
-            *self._download_snapd_snap_cmd(),
-            " ".join([""]),
+            '[ -d ${SNAPCRAFT_PART_SRC}/kernel ] && KERNEL_SRC=${SNAPCRAFT_PART_SRC} || KERNEL_SRC=${SNAPCRAFT_PROJECT_DIR}',
+            'echo "PATH=$PATH"',
+            'echo "KERNEL_SRC=${KERNEL_SRC}"',
+            "",
+            *_LINK_FILES_FNC_CMD,
+            "",
+            *_DOWNLOAD_CORE_INITRD_FNC_CMD,
+            "",
+            "",
+            *self._download_generic_initrd_cmd,
+            "",
+            *self._download_snapd_snap_cmd,
+            "",
             *self._clone_zfs_cmd(),
-            " ".join([""]),
+            "",
             *self._clean_old_build_cmd(),
-            " ".join(["\n"]),
+            "\n",
             *self._get_configure_command(),
-            # " ".join(["\n"]),
-            # *self._call_check_config_cmd(),
-            " ".join(["\n"]),
+            "\n",
+            *self._call_check_config_cmd(),
+            "\n",
             *self._get_build_command(),
-            " ".join(["\n"]),
+            "\n",
             *self._get_install_command(),
-            " ".join(["\n"]),
+            "\n",
             *self._get_zfs_build_commands(),
-            " ".join(["\n"]),
+            "\n",
             *self._get_perf_build_commands(),
-            " ".join(["\n"]),
-            " ".join(['echo "Kernel build finished!"']),
+            "\n",
+            'echo "Kernel build finished!"',
         ]
 
     @property